@@ -0,0 +1,241 @@
+"""
+Admission control for our web application
+
+Provides a bottle plugin that limits how many requests to a route run at once
+and sheds load with a fast 503 response when too many are waiting.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from bottle import request, abort, HTTPResponse
+
+# the stats for every limited route are served here to local clients
+ADMIN_PATH = '/admin/admission'
+
+# default limits, keyed by '<METHOD> <rule>' of the route they apply to.
+# With the default queue_size these hold at most three server threads, leaving
+# one of waitress's four default threads free for the product pages.
+ROUTE_LIMITS = {
+    'POST /cart': 2,
+}
+
+
+class TokenBucket(object):
+    """A token bucket holding up to burst tokens that refills at rate tokens per second"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """Take a token from the bucket, return 0 if we got one or otherwise
+        the number of seconds until the next token will be available"""
+
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RouteGate(object):
+    """Concurrency limit for a single route with a bounded queue of waiting requests.
+    in_flight - number of requests currently running the route
+    waiting - number of requests queued for a free slot
+    shed - number of requests turned away because the queue was full
+    timed_out - number of requests turned away because they waited too long"""
+
+    def __init__(self, limit, queue_size, timeout):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    def acquire(self):
+        """Wait for a free slot, return True if the request was admitted
+        or False if it should be shed"""
+
+        with self.condition:
+            if self.in_flight < self.limit and not self.waiting:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue_size:
+                self.shed += 1
+                return False
+            deadline = time.monotonic() + self.timeout
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self.condition.wait(remaining)
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        """Give back the slot taken by acquire"""
+
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def as_dict(self):
+        """Return a snapshot of the counters for this route"""
+
+        with self.condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'timed_out': self.timed_out,
+            }
+
+
+class AdmissionPlugin(object):
+    """Bottle plugin that applies admission control to selected routes.
+
+    limits - a dictionary mapping '<METHOD> <rule>' (eg. 'POST /cart') to the
+             maximum number of requests allowed to run that route at once.
+             Routes that are not mentioned (eg. the product pages) are not limited.
+    queue_size - the number of requests that may wait for a free slot on a route,
+             any more than this get an immediate 503 response.
+    timeout - the number of seconds a request will wait in the queue before it
+             gets a 503 response.
+    rate, burst - if rate is set, each session may only make rate requests per
+             second (with bursts of up to burst requests) to the limited routes,
+             requests over the limit get a 429 response.  Clients without a session
+             cookie share a bucket per address.
+    max_buckets - the number of token buckets kept, the least recently used are
+             forgotten first
+    allow - the client addresses allowed to see the stats at /admin/admission
+
+    Requests waiting in the queue hold a server thread, so for each limited route
+    the limit plus queue_size must stay below the number of threads the server
+    runs, otherwise browsing stops while the cart writes are saturated.
+
+    Install this plugin before the sqlite plugin so that requests are turned
+    away before they open a database connection."""
+
+    name = 'admission'
+    api = 2
+
+    def __init__(self, limits=None, queue_size=1, timeout=2.0, rate=None, burst=10, retry_after=1,
+                 max_buckets=10000, allow=('127.0.0.1', '::1')):
+        self.limits = dict(ROUTE_LIMITS if limits is None else limits)
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self.max_buckets = max_buckets
+        self.allow = allow
+        self.gates = {}
+        self.buckets = OrderedDict()
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def setup(self, app):
+        for other in app.plugins:
+            if isinstance(other, AdmissionPlugin) and other is not self:
+                raise RuntimeError("AdmissionPlugin is already installed on this app")
+
+        if not any(route.rule == ADMIN_PATH for route in app.routes):
+            app.route(ADMIN_PATH, callback=lambda: admission_report(app), skip=[self.name])
+
+    def apply(self, callback, route):
+        key = '%s %s' % (route.method, route.rule)
+        if key not in self.limits:
+            return callback
+
+        gate = self.gates.setdefault(key, RouteGate(self.limits[key], self.queue_size, self.timeout))
+
+        def wrapper(*args, **kwargs):
+            if self.rate:
+                wait = self._take_token()
+                if wait:
+                    raise self._reject(429, "Too many requests, please slow down", wait)
+            if not gate.acquire():
+                raise self._reject(503, "The store is busy, please try again shortly", self.retry_after)
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                gate.release()
+
+        return wrapper
+
+    def _take_token(self):
+        """Take a token from the bucket for the current session, return the number
+        of seconds to wait if there are none left"""
+
+        now = time.monotonic()
+        key = self._client_key()
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+                # forget the least recently used buckets
+                while len(self.buckets) > self.max_buckets:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            wait = bucket.take(now)
+            if wait:
+                self.throttled += 1
+            return wait
+
+    def _client_key(self):
+        """Identify the client by its beaker session id, or by address if it
+        didn't send a session cookie (a new session is made for every such request)"""
+
+        session = request.environ.get('beaker.session')
+        if session is not None and not session.is_new:
+            return 'session:' + session.id
+        return 'address:%s' % request.environ.get('REMOTE_ADDR')
+
+    def _reject(self, status, message, retry_after):
+        """Return the response used to turn a request away"""
+
+        return HTTPResponse(status=status, body=message,
+                            headers={'Retry-After': str(int(math.ceil(retry_after)))})
+
+    def stats(self):
+        """Return the queue depth and shed counts for every limited route"""
+
+        with self._lock:
+            throttled = self.throttled
+            sessions = len(self.buckets)
+        return {
+            'routes': dict((key, gate.as_dict()) for key, gate in self.gates.items()),
+            'throttled': throttled,
+            'sessions': sessions,
+        }
+
+
+def admission_report(app):
+    """Handler for /admin/admission, returns the stats of the installed AdmissionPlugin"""
+
+    plugins = [plugin for plugin in app.plugins if isinstance(plugin, AdmissionPlugin)]
+    if not plugins:
+        abort(404, "Admission control is not enabled")
+    if request.environ.get('REMOTE_ADDR') not in plugins[0].allow:
+        abort(403, "Not allowed")
+    return plugins[0].stats()
@@ -0,0 +1,52 @@
+"""
+Startup benchmark for the web application
+
+Measures, in fresh Python processes, how long it takes to import main.py,
+to build the app with create_app and to answer the first request, with and
+without precompiled templates and a primed catalog.  Run it from the project
+directory after creating the database with dbschema.py:
+
+    python bench_startup.py
+"""
+
+import json
+import subprocess
+import sys
+
+RUNS = 15
+
+# code run in each child process, prints its timings as JSON
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+application = main.create_app(precompile=%(preload)s, prime=%(preload)s)
+created = time.perf_counter()
+from webtest import TestApp
+client = TestApp(application)
+requested = time.perf_counter()
+client.get('/', status=200)
+answered = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': answered - requested}))
+"""
+
+
+def measure(preload):
+    """Return the median timings of RUNS fresh processes"""
+
+    results = []
+    for i in range(RUNS):
+        output = subprocess.check_output([sys.executable, '-c', CHILD % {'preload': preload}])
+        results.append(json.loads(output.decode().splitlines()[-1]))
+    return dict((key, sorted(r[key] for r in results)[RUNS // 2]) for key in results[0])
+
+
+if __name__ == '__main__':
+
+    for preload in [False, True]:
+        timings = measure(preload)
+        print("preload=%-5s import %6.1fms  create_app %6.1fms  first request %6.1fms  total %6.1fms" % (
+            preload, timings['import'] * 1000, timings['create_app'] * 1000,
+            timings['first_request'] * 1000, sum(timings.values()) * 1000))
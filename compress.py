@@ -0,0 +1,295 @@
+"""
+WSGI middleware that gzip compresses text responses for our web application
+"""
+
+import re
+import threading
+import time
+import zlib
+
+# content types that are worth compressing, anything starting with text/ is included too
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+# responses smaller than this many bytes are sent as they are
+MIN_SIZE = 512
+
+
+class CompressionStats(object):
+    """Counters describing the work done by the GzipMiddleware.
+    responses - number of responses that were compressed
+    skipped - number of responses that were sent uncompressed
+    bytes_in - total size of the compressed responses before compression
+    bytes_out - total size of the compressed responses after compression
+    seconds - CPU time spent inside zlib compressing responses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Set all of the counters back to zero"""
+
+        with self._lock:
+            self.responses = 0
+            self.skipped = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.seconds = 0.0
+
+    def record(self, bytes_in, bytes_out, seconds):
+        """Add the figures for one compressed response to the counters"""
+
+        with self._lock:
+            self.responses += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += seconds
+
+    def record_skip(self):
+        """Count a response that was sent uncompressed"""
+
+        with self._lock:
+            self.skipped += 1
+
+    def as_dict(self):
+        """Return a snapshot of the counters as a dictionary, including the
+        number of bytes saved and the average CPU time spent per compressed response"""
+
+        with self._lock:
+            return {
+                'responses': self.responses,
+                'skipped': self.skipped,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'bytes_saved': self.bytes_in - self.bytes_out,
+                'seconds': self.seconds,
+                'seconds_per_response': self.seconds / self.responses if self.responses else 0.0,
+            }
+
+
+def accepts_gzip(environ):
+    """Return True if the client said in Accept-Encoding that it can
+    handle a gzip encoded response (and did not give it a q value of zero).
+    An explicit gzip entry takes precedence over the * wildcard."""
+
+    header = environ.get('HTTP_ACCEPT_ENCODING', '')
+    explicit = wildcard = None
+    for part in header.split(','):
+        params = part.strip().split(';')
+        coding = params[0].strip().lower()
+        if coding not in ('gzip', 'x-gzip', '*'):
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding == '*':
+            wildcard = quality
+        else:
+            explicit = max(quality, explicit or 0.0)
+
+    if explicit is not None:
+        return explicit > 0
+    return wildcard is not None and wildcard > 0
+
+
+def _header(headers, name):
+    """Return the value of the named header from a WSGI header list, or None"""
+
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _gzip_etag(value):
+    """Return the ETag for the gzipped version of a response, it must differ
+    from the plain version's ETag since the bytes are different"""
+
+    if value.endswith('"'):
+        return value[:-1] + '-gzip"'
+    return value + '-gzip'
+
+
+def _strip_gzip_etags(value):
+    """Turn the ETags we gave gzipped responses back into the app's own ETags
+    in an If-None-Match header, so the app can still answer 304 Not Modified"""
+
+    # bottle's static_file sends its ETags without the quotes
+    return re.sub(r'-gzip("?)(?=\s*(,|$))', r'\1', value)
+
+
+def _add_vary(headers):
+    """Make sure the Vary header of the response mentions Accept-Encoding
+    so that caches keep the compressed and plain versions apart"""
+
+    for index, (key, value) in enumerate(headers):
+        if key.lower() == 'vary':
+            fields = [field.strip().lower() for field in value.split(',')]
+            if 'accept-encoding' not in fields and '*' not in fields:
+                headers[index] = (key, value + ', Accept-Encoding')
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
+
+
+class GzipMiddleware(object):
+    """WSGI middleware that compresses text responses with gzip when the
+    client accepts it.
+
+    It can wrap the bottle app directly or the beaker SessionMiddleware, eg:
+
+        GzipMiddleware(beaker.middleware.SessionMiddleware(app, session_opts))
+
+    Responses are left alone if they are not text, already have a Content-Encoding,
+    are marked Cache-Control: no-transform or are smaller than min_size bytes.
+    Bodies that are generated piece by piece are compressed as they are produced,
+    only the first min_size bytes are held back to decide whether to compress.
+    The counters in self.stats record how much was saved and what it cost."""
+
+    def __init__(self, app, min_size=MIN_SIZE, level=6, stats=None):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.stats = stats if stats is not None else CompressionStats()
+
+    def __call__(self, environ, start_response):
+        captured = {}
+        # anything passed to the legacy write() callable ends up at the front of the body
+        chunks = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            # nothing has been sent yet, so a later call (after an error) simply replaces the headers
+            captured['status'] = status
+            captured['headers'] = list(headers)
+            captured['exc_info'] = exc_info
+            return chunks.append
+
+        # the client may send back the ETag of a gzipped response, which the app doesn't know
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        revalidating = if_none_match is not None and _strip_gzip_etags(if_none_match) != if_none_match
+        if revalidating:
+            environ = dict(environ, HTTP_IF_NONE_MATCH=_strip_gzip_etags(if_none_match))
+
+        result = self.app(environ, capture_start_response)
+        try:
+            # hold back the start of the body until we know if it is big enough
+            iterator = iter(result)
+            size = sum(len(chunk) for chunk in chunks)
+            exhausted = False
+            # an app that returns a generator may only call start_response once it starts
+            while size < self.min_size or 'status' not in captured:
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if chunk:
+                    chunks.append(chunk)
+                    size += len(chunk)
+        except BaseException:
+            if hasattr(result, 'close'):
+                result.close()
+            raise
+
+        if 'status' not in captured:
+            raise RuntimeError("The application did not call start_response")
+
+        headers = captured['headers']
+        if revalidating and captured['status'][:3] == '304':
+            # the client's copy is the gzipped one, so keep its ETag
+            headers = [(key, _gzip_etag(value) if key.lower() == 'etag' else value) for key, value in headers]
+        if not self._compressible(environ, captured['status'], headers):
+            self.stats.record_skip()
+            start_response(captured['status'], headers, captured['exc_info'])
+            return _PlainBody(chunks, iterator, exhausted, result)
+
+        _add_vary(headers)
+        if size < self.min_size or not accepts_gzip(environ):
+            self.stats.record_skip()
+            start_response(captured['status'], headers, captured['exc_info'])
+            return _PlainBody(chunks, iterator, exhausted, result)
+
+        # the length and any byte ranges refer to the uncompressed body
+        headers = [(key, _gzip_etag(value) if key.lower() == 'etag' else value)
+                   for key, value in headers if key.lower() not in ('content-length', 'accept-ranges')]
+        headers.append(('Content-Encoding', 'gzip'))
+        start_response(captured['status'], headers, captured['exc_info'])
+        return _GzipBody(chunks, iterator, exhausted, result, self.level, self.stats)
+
+    def _compressible(self, environ, status, headers):
+        """Return True if this kind of response could be compressed at all,
+        this doesn't depend on the client or the size of the body"""
+
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return False
+        if status[:3] in ('204', '206', '304') or status[:1] == '1':
+            return False
+        if _header(headers, 'Content-Encoding'):
+            return False
+        if 'no-transform' in (_header(headers, 'Cache-Control') or '').lower():
+            return False
+        content_type = (_header(headers, 'Content-Type') or '').split(';')[0].strip().lower()
+        return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+class _PlainBody(object):
+    """Response body that replays the chunks we held back and then the
+    rest of the original body, unchanged"""
+
+    def __init__(self, chunks, iterator, exhausted, result):
+        self.chunks = chunks
+        self.iterator = iterator
+        self.exhausted = exhausted
+        self.result = result
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        self.chunks = []
+        if not self.exhausted:
+            for chunk in self.iterator:
+                yield chunk
+
+    def close(self):
+        if hasattr(self.result, 'close'):
+            self.result.close()
+
+
+class _GzipBody(_PlainBody):
+    """Response body that gzip compresses the original body as it is iterated"""
+
+    def __init__(self, chunks, iterator, exhausted, result, level, stats):
+        _PlainBody.__init__(self, chunks, iterator, exhausted, result)
+        # 16 + MAX_WBITS asks zlib for the gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.stats = stats
+
+    def __iter__(self):
+        bytes_in = bytes_out = 0
+        seconds = 0.0
+        for chunk in _PlainBody.__iter__(self):
+            if not chunk:
+                continue
+            started = time.thread_time()
+            data = self.compressor.compress(chunk)
+            seconds += time.thread_time() - started
+            bytes_in += len(chunk)
+            if data:
+                bytes_out += len(data)
+                yield data
+        started = time.thread_time()
+        data = self.compressor.flush()
+        seconds += time.thread_time() - started
+        bytes_out += len(data)
+        self.stats.record(bytes_in, bytes_out, seconds)
+        yield data
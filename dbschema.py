@@ -7,6 +7,22 @@ import os
 # the name of our database file
 DATABASE_NAME = 'shop.db'
 
+# the products table, shared by the main database and the category shards (see shards.py)
+PRODUCTS_TABLE = """
+    DROP TABLE IF EXISTS products;
+    CREATE TABLE products (
+            id integer unique primary key autoincrement,
+            name text,
+            description text,
+            image_url text,
+            category text,
+            inventory integer,
+            unit_cost number
+            );
+"""
+
+INSERT_PRODUCT = "INSERT INTO products (id, name, description, image_url, category, inventory, unit_cost) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
 
 def connect(database=DATABASE_NAME):
     """Return a database connection, by default to
@@ -32,18 +48,7 @@ def create_tables(db):
             sessionid text unique primary key,
             data text
     );
-    
-    DROP TABLE IF EXISTS products;
-    CREATE TABLE products (
-            id integer unique primary key autoincrement,
-            name text,
-            description text,
-            image_url text,
-            category text,
-            inventory integer,
-            unit_cost number
-            );
-    """
+    """ + PRODUCTS_TABLE
 
     db.executescript(sql)
     db.commit()
@@ -51,26 +56,65 @@ def create_tables(db):
 
 # sample data from https://github.com/shopifypartners/product-csvs/blob/master/apparel.csv
 
-def sample_data(db):
+def sample_data(db, layout=None):
     """Generate some sample data for testing the web
     application. Erases any existing data in the
     database
-    Returns the list of users and the list of positions
-    that are inserted into the database"""
+    If layout is a shards.ShardLayout the products are written to the
+    category shard files instead of the products table in db, each shard
+    is loaded and committed through its own connection.
+    Returns a dictionary of the products that are inserted into the
+    database, keyed by product name"""
 
+    if layout is not None:
+        return _sample_data_sharded(layout)
 
     cursor = db.cursor()
     cursor.execute("DELETE FROM products")
 
-    # read sample product data from apparel.csv
     products = {}
-    id = 0
+    for id, row in enumerate(_sample_rows()):
+        cursor.execute(INSERT_PRODUCT, (id,) + row)
+        products[row[0]] = _sample_product(id, row)
+
+    db.commit()
+
+    return products
+
+
+def _sample_data_sharded(layout):
+    """Write the sample data into the shards of layout, giving each product
+    an id from the range belonging to its shard"""
+
+    rows = {}
+    for row in _sample_rows():
+        rows.setdefault(layout.shard_for_category(row[3]), []).append(row)
+
+    products = {}
+    for shard in range(len(layout.names)):
+        db = layout.connect(shard)
+        try:
+            db.execute("DELETE FROM products")
+            for id, row in enumerate(rows.get(shard, []), layout.base_id(shard)):
+                db.execute(INSERT_PRODUCT, (id,) + row)
+                products[row[0]] = _sample_product(id, row)
+            db.commit()
+        finally:
+            db.close()
+
+    return products
+
+
+def _sample_rows():
+    """Read sample product data from apparel.csv
+    Returns a list of tuples (name, description, image_url, category, inventory, unit_cost)"""
+
+    rows = []
     first = True  # flag
-    sql = "INSERT INTO products (id, name, description, image_url, category, inventory, unit_cost) VALUES (?, ?, ?, ?, ?, ?, ?)"
     with open(os.path.join(os.path.dirname(__file__), 'apparel.csv')) as fd:
         reader = csv.DictReader(fd)
         for row in reader:
-            if row['Title'] is not '':
+            if row['Title'] != '':
                 if first:
                     inv = 0  # inventory of first item (Ocean Blue Shirt) is zero
                     first = False
@@ -78,14 +122,15 @@ def sample_data(db):
                     inv = int(random.random()*100)
                 cost = int(random.random()*200) + 0.95
                 description = "<p>" + row['Body (HTML)'] + "</p>"
-                data = (id, row['Title'], description, row['Image Src'], row['Tags'], inv, cost)
-                cursor.execute(sql, data)
-                products[row['Title']] = {'id': id, 'name': row['Title'], 'description': description, 'category': row['Tags'], 'inventory': inv, 'unit_cost': cost}
-                id += 1
+                rows.append((row['Title'], description, row['Image Src'], row['Tags'], inv, cost))
+    return rows
 
-    db.commit()
 
-    return products
+def _sample_product(id, row):
+    """Return the dictionary describing a sample product as returned by sample_data"""
+
+    name, description, image_url, category, inv, cost = row
+    return {'id': id, 'name': name, 'description': description, 'category': category, 'inventory': inv, 'unit_cost': cost}
 
 
 def dump_database(db, table):
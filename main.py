@@ -1,11 +1,28 @@
-import random
+import os
+import bottle
 from bottle import Bottle, template, static_file, request, redirect, abort
 
 import model
+import pricing
 import session
 
 app = Bottle()
 
+# where our templates live
+VIEWS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'views')
+
+# keep compiled templates between requests, set by create_app
+TEMPLATE_CACHE = True
+
+
+def render(name, info):
+    """Render the named template with info, if TEMPLATE_CACHE is False the
+    template is read and compiled again so that edits show up straight away"""
+
+    if not TEMPLATE_CACHE:
+        bottle.TEMPLATES.clear()
+    return template(name, info)
+
 
 @app.route('/')
 def index(db):
@@ -18,7 +35,7 @@ def index(db):
     list = model.product_list(db)
     info['list'] = list
     info['title'] = ""
-    return template('index', info)
+    return render('index', info)
 
 
 @app.route('/welcome')
@@ -30,7 +47,7 @@ def index(db):
         'title': "Welcome to WT! The innovative online store",
         'list': {}
     }
-    return template('index', info)
+    return render('index', info)
 
 
 @app.route('/category/<cat>')
@@ -50,9 +67,9 @@ def index(db, cat):
             'title': "No products in this category",
             'list': {}
         }
-        return template('index', info)
+        return render('index', info)
     else:
-        return template('index', info)
+        return render('index', info)
 
 
 @app.route('/product/<id>')
@@ -66,7 +83,7 @@ def index(db, id):
             'title': "The product does not exist",
             'products': {}
         }
-        return template('product', info)
+        return render('product', info)
     else:
         products = []
         products.append(product)
@@ -74,7 +91,7 @@ def index(db, id):
             'title': "",
             'products': products
         }
-        return template('product', info)
+        return render('product', info)
 
 
 @app.post('/cart')
@@ -93,13 +110,17 @@ def index(db):
     """This is the get method for the cart route that is called whenever we do not have a
     post request. Called if the user clicks the cart directly or when the function above redirects.
     This function gets the cart content uses the function in the session.py file.
+    The cart is repriced against the current catalog with a single query, see pricing.py,
+    so lines whose price has changed or that are now out of stock can be flagged.
     """
     cart = session.get_cart_contents()
+    lines, total = pricing.price_cart(db, cart)
     info = {
         'title': "",
-        'products': cart
+        'products': lines,
+        'total': pricing.format_cents(total)
     }
-    return template('cart', info)
+    return render('cart', info)
 
 
 @app.route('/static/<filename:path>')
@@ -107,19 +128,98 @@ def static(filename):
     return static_file(filename=filename, root='static')
 
 
-if __name__ == '__main__':
-    from bottle import run
+def create_app(db_path=None, session_opts=None, caches=True, precompile=False, prime=False,
+               compress=True, admission=True, layout=None, profile_memory=False):
+    """Configure the app and return the WSGI application to serve.
+    db_path - the database file, by default dbschema.DATABASE_NAME
+    session_opts - options for the beaker session middleware, by default sessions are kept in memory
+    caches - if False, templates are reloaded on every request
+    precompile - compile every template in views/ now rather than on the first request that uses it,
+                 this needs caches to be on
+    prime - read the catalog once before the first request; each request opens its own connection
+            so nothing is kept in the process, this only gets the database files (and any shards)
+            into the operating system's page cache
+    compress - gzip text responses, see compress.py
+    admission - limit concurrent cart writes, see admission.py, either True for the default
+                limits or a configured AdmissionPlugin; the stats are served at /admin/admission
+    layout - a shards.ShardLayout if the catalog is sharded
+    profile_memory - trace memory use per route and report it at /admin/memory, see memprofile.py
+
+    The plugins and middleware are only imported here, so importing this module stays cheap.
+    Calling this again reconfigures the app rather than installing the plugins twice.
+    A server that forks workers can call this before forking so every worker starts ready."""
+
     from bottle.ext import sqlite, beaker
-    from dbschema import DATABASE_NAME
+    import dbschema
+    import shards
 
-    # install the database plugin
-    app.install(sqlite.Plugin(dbfile=DATABASE_NAME))
+    if precompile and not caches:
+        raise ValueError("precompile=True has no effect with caches=False, templates are reloaded on every request")
 
-    # install beaker
-    session_opts = {
-        'session.type': 'memory',
-    }
+    if db_path is None:
+        db_path = dbschema.DATABASE_NAME
+    if session_opts is None:
+        session_opts = {
+            'session.type': 'memory',
+        }
+
+    if VIEWS_DIR not in bottle.TEMPLATE_PATH:
+        bottle.TEMPLATE_PATH.insert(0, VIEWS_DIR)
+    global TEMPLATE_CACHE
+    TEMPLATE_CACHE = caches
+
+    shards.configure(layout)
+
+    # admission control goes first so busy requests never open the database
+    app.uninstall('admission')
+    app.uninstall('memprofile')
+    app.uninstall('sqlite')
+    if admission:
+        from admission import AdmissionPlugin
+        app.install(admission if isinstance(admission, AdmissionPlugin) else AdmissionPlugin())
+    if profile_memory:
+        from memprofile import MemoryProfilePlugin
+        app.install(MemoryProfilePlugin(session_type=session_opts.get('session.type')))
+    app.install(sqlite.Plugin(dbfile=db_path))
+
+    if precompile:
+        precompile_templates()
+    if prime:
+        db = dbschema.connect(db_path)
+        try:
+            model.product_list(db)
+        finally:
+            db.close()
+
+    application = beaker.middleware.SessionMiddleware(app, session_opts)
+    if compress:
+        from compress import GzipMiddleware
+        # compress the product listings and other pages on their way out
+        application = GzipMiddleware(application)
+
+    return application
+
+
+def precompile_templates():
+    """Compile every template in views/ and put it in bottle's template cache,
+    templates that rebase or include another template share its compiled copy"""
+
+    compiled = {}
+    for filename in sorted(os.listdir(VIEWS_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext != '.html':
+            continue
+        tpl = bottle.SimpleTemplate(name=name, lookup=bottle.TEMPLATE_PATH)
+        # bottle compiles a template the first time its code is used, so ask for it now
+        _ = tpl.co
+        compiled[filename] = tpl
+        bottle.TEMPLATES[(id(bottle.TEMPLATE_PATH), name)] = tpl
+
+    for tpl in compiled.values():
+        tpl.cache.update(compiled)
 
-    beaker_app = beaker.middleware.SessionMiddleware(app, session_opts)
 
-    run(app=beaker_app, debug=True, port=8010)
+if __name__ == '__main__':
+    from bottle import run
+
+    run(app=create_app(caches=False), debug=True, port=8010)
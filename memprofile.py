@@ -0,0 +1,203 @@
+"""
+Memory profiling for our web application
+
+Provides a bottle plugin built on tracemalloc that records how much memory
+each route allocates and keeps, and an admin page at /admin/memory that
+reports the figures along with the largest allocation sites and the size
+of the session store.  Nothing is traced unless the plugin is installed.
+"""
+
+import binascii
+import pickle
+import threading
+import tracemalloc
+
+from bottle import request, abort
+
+ADMIN_PATH = '/admin/memory'
+
+
+class RouteMemory(object):
+    """Memory figures for one route.
+    requests - number of requests measured
+    peak - the largest peak allocation seen during a single request, in bytes
+    retained - total memory still allocated after the requests finished, in bytes"""
+
+    def __init__(self):
+        self.requests = 0
+        self.peak = 0
+        self.retained = 0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'peak': self.peak,
+            'retained': self.retained,
+            'retained_per_request': self.retained // self.requests if self.requests else 0,
+        }
+
+
+class MemoryProfilePlugin(object):
+    """Bottle plugin that measures the memory allocated by each route using tracemalloc.
+
+    frames - the number of stack frames tracemalloc keeps for each allocation
+    top - the number of allocation sites shown in the report
+    allow - the client addresses allowed to see the report at /admin/memory
+    session_type - the beaker session.type in use, the session store can only
+             be measured when it is 'memory'
+
+    Tracing starts when the plugin is installed and stops when it is uninstalled.
+    With several requests running at once their allocations overlap, so the
+    per-route figures are most accurate on a single threaded server."""
+
+    name = 'memprofile'
+    api = 2
+
+    def __init__(self, frames=10, top=10, allow=('127.0.0.1', '::1'), session_type='memory'):
+        self.frames = frames
+        self.top = top
+        self.allow = allow
+        self.session_type = session_type
+        self.routes = {}
+        self.baseline = None
+        self.started = False
+        self._lock = threading.Lock()
+
+    def setup(self, app):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started = True
+        self.baseline = tracemalloc.take_snapshot()
+
+        if not any(route.rule == ADMIN_PATH for route in app.routes):
+            app.route(ADMIN_PATH, callback=lambda: memory_report(app), skip=[self.name])
+
+    def close(self):
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def apply(self, callback, route):
+        key = '%s %s' % (route.method, route.rule)
+
+        def wrapper(*args, **kwargs):
+            before = tracemalloc.get_traced_memory()[0]
+            # before python 3.9 the peak can't be reset so it covers the whole run
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                self.record(key, peak - before, current - before)
+
+        return wrapper
+
+    def record(self, key, peak, retained):
+        """Add the figures for one request to route key"""
+
+        with self._lock:
+            stats = self.routes.setdefault(key, RouteMemory())
+            stats.requests += 1
+            stats.peak = max(stats.peak, peak)
+            stats.retained += retained
+
+    def snapshot_diff(self, reset=False):
+        """Return the allocation sites that have grown the most since the baseline
+        snapshot as a list of dictionaries, largest first.  If reset is True the
+        current snapshot becomes the new baseline."""
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        stats = snapshot.compare_to(self.baseline, 'lineno')
+        if reset:
+            self.baseline = snapshot
+
+        sites = []
+        for stat in stats[:self.top]:
+            frame = stat.traceback[0]
+            sites.append({
+                'site': '%s:%d' % (frame.filename, frame.lineno),
+                'size': stat.size,
+                'size_diff': stat.size_diff,
+                'count': stat.count,
+                'count_diff': stat.count_diff,
+            })
+        return sites
+
+    def report(self, reset=False):
+        """Return everything we know about memory use as a dictionary"""
+
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            routes = dict((key, stats.as_dict()) for key, stats in self.routes.items())
+        return {
+            'traced': {'current': current, 'peak': peak},
+            'routes': routes,
+            'sites': self.snapshot_diff(reset),
+            'sessions': session_store_stats(self.session_type),
+        }
+
+
+def memory_report(app):
+    """Handler for /admin/memory, adding ?reset=1 to the URL makes the
+    current snapshot the baseline for the next report"""
+
+    plugins = [plugin for plugin in app.plugins if isinstance(plugin, MemoryProfilePlugin)]
+    if not plugins:
+        abort(404, "Memory profiling is not enabled")
+    plugin = plugins[0]
+    if request.environ.get('REMOTE_ADDR') not in plugin.allow:
+        abort(403, "Not allowed")
+    return plugin.report(reset=bool(request.query.get('reset')))
+
+
+def session_store_stats(session_type='memory'):
+    """Return the number of sessions in beaker's in-memory session store, the
+    bytes they take up in the store and the size in bytes of the carts they
+    hold (measured by pickling them).
+    Returns None if the sessions are kept somewhere else (session_type is the
+    beaker session.type) since we can't see them from this process."""
+
+    if session_type != 'memory':
+        return None
+    try:
+        from beaker.container import MemoryNamespaceManager
+    except ImportError:
+        return None
+
+    sessions = 0
+    stored = 0
+    cart_sizes = []
+    for namespace in list(MemoryNamespaceManager.namespaces.dict.values()):
+        data = namespace.get('session')
+        if data is None:
+            continue
+        sessions += 1
+        if isinstance(data, (str, bytes)):
+            # beaker stores the session pickled and base64 encoded
+            stored += len(data)
+            data = _load_session(data)
+        if isinstance(data, dict) and 'cart' in data:
+            cart_sizes.append(len(pickle.dumps(data['cart'])))
+
+    return {
+        'sessions': sessions,
+        'session_bytes': stored,
+        'carts': len(cart_sizes),
+        'cart_bytes': sum(cart_sizes),
+        'cart_bytes_mean': sum(cart_sizes) // len(cart_sizes) if cart_sizes else 0,
+        'cart_bytes_max': max(cart_sizes) if cart_sizes else 0,
+    }
+
+
+def _load_session(data):
+    """Decode session data stored by beaker with its default pickle serializer,
+    return None if it was stored some other way (eg. encrypted)"""
+
+    try:
+        return pickle.loads(binascii.a2b_base64(data))
+    except Exception:
+        return None
@@ -4,13 +4,30 @@ Database model for Online Store
 Provides functions to access the database
 """
 
+# the shards.ShardLayout in use, set by shards.configure, None means all of the
+# products are in the products table of the request's database.  Keeping it here
+# means the sharding code is only imported by apps that use it.
+LAYOUT = None
+
+COLUMNS = "id, name, description, category, image_url, unit_cost, inventory"
+
 
 def product_get(db, id):
     """Return the product with the given id or None if
     it can't be found.
+    If the catalog is sharded the query goes to the shard owning the id.
     Returns a sqlite3.Row object"""
 
-    sql = """SELECT id, name, description, category, image_url, unit_cost, inventory FROM products WHERE id=?"""
+    layout = LAYOUT
+    if layout:
+        shard = layout.shard_for_id(id)
+        if shard is None:
+            return None
+        table = layout.attach(db, shard) + '.products'
+    else:
+        table = 'products'
+
+    sql = "SELECT " + COLUMNS + " FROM " + table + " WHERE id=?"
     cur = db.cursor()
     cur.execute(sql, (id,))
 
@@ -20,18 +37,66 @@ def product_get(db, id):
 def product_list(db, category=None):
     """Return a list of products, if category is not None, return products from
     that category. Results are returned in no particular order.
+    If the catalog is sharded a category is read from its own shard and the
+    full list is merged from all of the shards.
     Returns a list of tuples (id, name, description, category, image_url, unit_cost, inventory)"""
 
+    layout = LAYOUT
+    if layout:
+        if category:
+            tables = [layout.attach(db, layout.shard_for_category(category)) + '.products']
+        else:
+            tables = [layout.attach(db, shard) + '.products' for shard in range(len(layout.names))]
+    else:
+        tables = ['products']
+
     cur = db.cursor()
+    result = []
+    for table in tables:
+        if category:
+            sql = "SELECT " + COLUMNS + " FROM " + table + " WHERE category = ?"
+            cur.execute(sql, (category,))
+        else:
+            sql = "SELECT " + COLUMNS + " FROM " + table
+            cur.execute(sql)
+        result.extend(cur.fetchall())
 
-    if category:
-        sql = """SELECT id, name, description, category, image_url, unit_cost, inventory 
-        FROM products WHERE category = ?
-        """
-        cur.execute(sql, (category,))
-    else:
-        sql = 'SELECT id, name, description, category, image_url, unit_cost, inventory FROM products'
-        cur.execute(sql)
+    return result
+
+
+def product_get_many(db, ids):
+    """Return the products with the given ids in a single query (one per
+    shard if the catalog is sharded). Ids that can't be found are left out.
+    Returns a dictionary of sqlite3.Row objects keyed by the integer product id"""
 
-    return cur.fetchall()
+    wanted = set()
+    for id in ids:
+        try:
+            wanted.add(int(id))
+        except (TypeError, ValueError):
+            pass
+
+    layout = LAYOUT
+    groups = {}
+    for id in wanted:
+        if layout:
+            shard = layout.shard_for_id(id)
+            if shard is None:
+                continue
+            table = layout.attach(db, shard) + '.products'
+        else:
+            table = 'products'
+        groups.setdefault(table, []).append(id)
+
+    cur = db.cursor()
+    result = {}
+    for table, group in groups.items():
+        # stay well under sqlite's limit on the number of parameters in a query
+        for start in range(0, len(group), 500):
+            chunk = group[start:start + 500]
+            sql = "SELECT " + COLUMNS + " FROM " + table + " WHERE id IN (" + ", ".join(["?"] * len(chunk)) + ")"
+            cur.execute(sql, chunk)
+            for row in cur.fetchall():
+                result[row['id']] = row
 
+    return result
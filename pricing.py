@@ -0,0 +1,84 @@
+"""
+Cart pricing for our web application
+
+Reprices the shopping cart against the current catalog.  All of the
+products in the cart are fetched with one query and the arithmetic is done
+in integer cents so that rounding never creeps into the totals.
+"""
+
+import model
+
+
+def to_cents(amount):
+    """Convert an amount in dollars to a whole number of cents"""
+
+    return int(round(float(amount) * 100))
+
+
+def format_cents(cents):
+    """Format a number of cents as dollars, eg. 4295 becomes '42.95'"""
+
+    sign = '-' if cents < 0 else ''
+    return '%s%d.%02d' % (sign, abs(cents) // 100, abs(cents) % 100)
+
+
+def product_id(id):
+    """Return the cart entry id as an integer product id, or None if it isn't one.
+    Carts saved before add_to_cart stored the product's own id may hold ids like
+    '3.0', which sqlite matches to product 3, so they are accepted here too."""
+
+    try:
+        return int(id)
+    except (TypeError, ValueError):
+        pass
+    try:
+        number = float(id)
+    except (TypeError, ValueError):
+        return None
+    if number.is_integer():
+        return int(number)
+    return None
+
+
+def price_cart(db, cart):
+    """Reprice the cart (as returned by session.get_cart_contents) using
+    the current price and inventory of each product.
+
+    Returns a tuple (lines, total) where total is the cart total in cents and
+    lines is a list of dictionaries, one for each entry in the cart:
+        {'id': <id>, 'name': <name>, 'quantity': <qty>,
+         'unit_cents': <current unit cost in cents>, 'cost_cents': <line total in cents>,
+         'cost': <line total formatted as dollars>,
+         'repriced': <True if the line cost has changed since it was added>,
+         'out_of_stock': <True if the product is gone, its id isn't valid or it has too little inventory>}
+    Lines that are out of stock are not included in the total."""
+
+    ids = [product_id(entry['id']) for entry in cart]
+    products = model.product_get_many(db, [id for id in ids if id is not None])
+    found = [products.get(id) for id in ids]
+
+    lines = []
+    total = 0
+    for entry, product in zip(cart, found):
+        quantity = int(entry['quantity'])
+        if product is None:
+            unit_cents = 0
+            in_stock = False
+        else:
+            unit_cents = to_cents(product['unit_cost'])
+            in_stock = product['inventory'] >= quantity
+        cost_cents = quantity * unit_cents
+        if in_stock:
+            total += cost_cents
+        lines.append({
+            'id': entry['id'],
+            'name': product['name'] if product is not None else entry['name'],
+            'quantity': quantity,
+            'unit_cents': unit_cents,
+            'cost_cents': cost_cents,
+            'cost': format_cents(cost_cents),
+            'repriced': product is not None and cost_cents != to_cents(entry['cost']),
+            'out_of_stock': not in_stock,
+        })
+
+    return lines, total
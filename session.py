@@ -20,12 +20,15 @@ def add_to_cart(db, itemid, quantity):
         2. if the quantity selected by the user is less than or equal to what we have in the inventory
         3. if the product already exists in the cart, then update the values.
 
+    The id stored in the cart is always the product's integer id from the database.
     A list of dictionaries of products is cart in the session of beaker.
     The dictionary is a key value pair of the ID, Quantity, Name and Cost of a product."""
     session = request.environ.get('beaker.session')
     cart = session.get('cart', [])
     product = model.product_get(db, itemid)
     if product:
+        # sqlite matches ids like '3.0' to product 3, keep the product's own id in the cart
+        itemid = product['id']
         cost = product['unit_cost']
         name = product['name']
         inventory = product['inventory']
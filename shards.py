@@ -0,0 +1,130 @@
+"""
+Optional sharded layout for the product catalog
+
+Instead of one products table in shop.db, each category has a products table
+in its own SQLite file, so loading or updating one category does not take the
+write lock on the others.  The shard files are attached to the request's
+database connection the first time a query needs them.
+
+Product ids stay globally unique because each shard owns its own range of
+ids: shard n holds ids n * SHARD_STRIDE up to (n + 1) * SHARD_STRIDE - 1,
+so the shard holding a product can be worked out from its id alone.
+"""
+
+import os
+import sqlite3
+
+import dbschema
+import model
+
+# number of product ids reserved for each shard
+SHARD_STRIDE = 1000000
+
+# shard used for products whose category has no shard of its own
+OTHER = 'other'
+
+# the products table in a shard, like dbschema.PRODUCTS_TABLE but limited to the shard's ids
+SHARD_PRODUCTS_TABLE = """
+    DROP TABLE IF EXISTS products;
+    CREATE TABLE products (
+            id integer unique primary key autoincrement
+                CHECK (id >= %(low)d AND id < %(high)d),
+            name text,
+            description text,
+            image_url text,
+            category text,
+            inventory integer,
+            unit_cost number
+            );
+"""
+
+
+def configure(layout):
+    """Make model.py read products from the shards of layout,
+    or from the products table of the main database if layout is None"""
+
+    model.LAYOUT = layout
+
+
+def current():
+    """Return the configured ShardLayout or None"""
+
+    return model.LAYOUT
+
+
+class ShardLayout(object):
+    """Describes where the shard files live and which categories they hold.
+    directory - the directory containing the shard files
+    categories - the categories that get a shard each, any other category
+                 goes in a shared 'other' shard"""
+
+    def __init__(self, directory, categories=('men', 'women')):
+        self.directory = directory
+        self.names = tuple(categories) + (OTHER,)
+
+    def shard_for_category(self, category):
+        """Return the number of the shard holding products in category"""
+
+        if category in self.names[:-1]:
+            return self.names.index(category)
+        return len(self.names) - 1
+
+    def shard_for_id(self, id):
+        """Return the number of the shard holding the product with this id,
+        or None if no shard could hold it"""
+
+        try:
+            shard = int(id) // SHARD_STRIDE
+        except (TypeError, ValueError):
+            return None
+        if 0 <= shard < len(self.names):
+            return shard
+        return None
+
+    def base_id(self, shard):
+        """Return the first product id belonging to shard"""
+
+        return shard * SHARD_STRIDE
+
+    def filename(self, shard):
+        """Return the path of the database file for shard"""
+
+        return os.path.join(self.directory, 'shop-%s.db' % self.names[shard])
+
+    def alias(self, shard):
+        """Return the schema name shard is attached under"""
+
+        return 'shard_%d' % shard
+
+    def connect(self, shard):
+        """Return a new connection to a single shard, for loading data"""
+
+        return dbschema.connect(self.filename(shard))
+
+    def create_tables(self):
+        """Create the products table in every shard, erasing any existing data.
+        Each table only accepts ids from its own shard's range and new ids
+        are allocated from the start of that range."""
+
+        for shard in range(len(self.names)):
+            base = self.base_id(shard)
+            db = self.connect(shard)
+            try:
+                db.executescript(SHARD_PRODUCTS_TABLE % {'low': base, 'high': base + SHARD_STRIDE})
+                db.execute("DELETE FROM sqlite_sequence WHERE name = 'products'")
+                db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('products', ?)", (base - 1,))
+                db.commit()
+            finally:
+                db.close()
+
+    def attach(self, db, shard):
+        """Attach the file for shard to the connection db if it isn't already
+        and return the schema name to use in queries"""
+
+        alias = self.alias(shard)
+        try:
+            db.execute("ATTACH DATABASE ? AS %s" % alias, (self.filename(shard),))
+        except sqlite3.OperationalError as error:
+            if 'already in use' not in str(error):
+                raise
+        return alias
@@ -0,0 +1,177 @@
+import unittest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bottle
+from beaker.middleware import SessionMiddleware
+from webtest import TestApp
+
+import admission
+
+
+class AdmissionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.entered = threading.Semaphore(0)
+        self.app = bottle.Bottle()
+
+        @self.app.post('/cart')
+        def cart():
+            self.entered.release()
+            self.release.wait(5)
+            return "added"
+
+        @self.app.get('/')
+        def home():
+            return "home"
+
+    def start_writes(self, count):
+        """Start count POST /cart requests in the background"""
+
+        threads = [threading.Thread(target=TestApp(self.app).post, args=('/cart',), kwargs={'expect_errors': True})
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_shed_when_queue_full(self):
+        """Once the route is busy and the queue is full we get a fast 503 with Retry-After,
+        other routes keep working"""
+
+        plugin = admission.AdmissionPlugin({'POST /cart': 1}, queue_size=0, timeout=5)
+        self.app.install(plugin)
+
+        threads = self.start_writes(1)
+        self.assertTrue(self.entered.acquire(timeout=5))
+
+        app = TestApp(self.app)
+        response = app.post('/cart', status=503)
+        self.assertEqual('1', response.headers['Retry-After'])
+        self.assertEqual('home', app.get('/').text)
+
+        stats = plugin.stats()['routes']['POST /cart']
+        self.assertEqual(1, stats['in_flight'])
+        self.assertEqual(1, stats['shed'])
+
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(0, plugin.stats()['routes']['POST /cart']['in_flight'])
+
+    def test_browse_with_fixed_worker_pool(self):
+        """With the default limits a server with four threads still serves the
+        home page while the cart writes are saturated"""
+
+        plugin = admission.AdmissionPlugin()
+        self.app.install(plugin)
+        app = TestApp(self.app)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            writes = [pool.submit(app.post, '/cart', expect_errors=True) for i in range(8)]
+            browse = pool.submit(app.get, '/')
+            try:
+                self.assertEqual('home', browse.result(timeout=5).text)
+                self.assertGreater(plugin.stats()['routes']['POST /cart']['shed'], 0)
+            finally:
+                self.release.set()
+            statuses = [write.result().status_code for write in writes]
+
+        self.assertGreaterEqual(statuses.count(200), 2)
+        self.assertEqual(len(statuses), statuses.count(200) + statuses.count(503))
+
+    def test_queue_timeout(self):
+        """A request that waits in the queue past the deadline gets a 503"""
+
+        plugin = admission.AdmissionPlugin({'POST /cart': 1}, queue_size=1, timeout=0.05)
+        self.app.install(plugin)
+
+        threads = self.start_writes(1)
+        self.assertTrue(self.entered.acquire(timeout=5))
+
+        TestApp(self.app).post('/cart', status=503)
+        self.assertEqual(1, plugin.stats()['routes']['POST /cart']['timed_out'])
+
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_session_rate_limit(self):
+        """Each session has a token bucket for cart writes"""
+
+        self.release.set()
+        plugin = admission.AdmissionPlugin(rate=0.01, burst=2)
+        self.app.install(plugin)
+        app = TestApp(self.app)
+
+        app.post('/cart')
+        app.post('/cart')
+        response = app.post('/cart', status=429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(1, plugin.stats()['throttled'])
+
+    def test_rate_limit_without_cookie(self):
+        """Clients that don't keep the session cookie share a bucket for their address,
+        clients with a session have their own bucket"""
+
+        self.release.set()
+
+        @self.app.get('/login')
+        def login():
+            session = bottle.request.environ['beaker.session']
+            session['cart'] = []
+            session.save()
+            return "ok"
+
+        plugin = admission.AdmissionPlugin(rate=0.01, burst=2)
+        self.app.install(plugin)
+        app = TestApp(SessionMiddleware(self.app, {'session.type': 'memory'}))
+
+        for i in range(2):
+            app.post('/cart')
+            app.reset()
+        app.post('/cart', status=429)
+        app.reset()
+        self.assertEqual(1, len(plugin.buckets))
+
+        # a client with a session cookie is counted separately
+        app.get('/login')
+        app.post('/cart')
+        app.post('/cart')
+        app.post('/cart', status=429)
+        self.assertEqual(2, len(plugin.buckets))
+
+    def test_bucket_limit(self):
+        """Only max_buckets buckets are kept"""
+
+        self.release.set()
+        plugin = admission.AdmissionPlugin(rate=1, burst=1, max_buckets=3)
+        self.app.install(plugin)
+        app = TestApp(self.app)
+
+        for i in range(10):
+            app.post('/cart', extra_environ={'REMOTE_ADDR': '10.0.0.%d' % i})
+        self.assertEqual(3, len(plugin.buckets))
+
+    def test_admin_stats(self):
+        """The stats are served to local clients"""
+
+        self.release.set()
+        self.app.install(admission.AdmissionPlugin({'POST /cart': 2}))
+        app = TestApp(self.app, extra_environ={'REMOTE_ADDR': '127.0.0.1'})
+
+        app.post('/cart')
+        stats = app.get(admission.ADMIN_PATH).json
+        self.assertEqual(1, stats['routes']['POST /cart']['admitted'])
+        app.get(admission.ADMIN_PATH, extra_environ={'REMOTE_ADDR': '10.1.1.1'}, status=403)
+
+    def test_token_bucket_refills(self):
+        """Tokens come back at the given rate"""
+
+        bucket = admission.TokenBucket(rate=2, burst=1, now=0)
+        self.assertEqual(0, bucket.take(0))
+        self.assertAlmostEqual(0.5, bucket.take(0))
+        self.assertEqual(0, bucket.take(0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
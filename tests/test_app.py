@@ -0,0 +1,52 @@
+import unittest
+import bottle
+
+import main
+
+
+class AppFactoryTests(unittest.TestCase):
+
+    def test_plugins_installed_once(self):
+        """Calling create_app again replaces the plugins rather than adding more"""
+
+        main.create_app(db_path=':memory:')
+        main.create_app(db_path=':memory:')
+
+        names = [getattr(plugin, 'name', None) for plugin in main.app.plugins]
+        self.assertEqual(1, names.count('sqlite'))
+        self.assertEqual(1, names.count('admission'))
+        # admission control must wrap the database plugin
+        self.assertLess(names.index('admission'), names.index('sqlite'))
+
+        main.create_app(db_path=':memory:', admission=False)
+        self.assertNotIn('admission', [getattr(plugin, 'name', None) for plugin in main.app.plugins])
+
+    def test_caches_flag(self):
+        """Turning the template cache off and on again doesn't touch bottle's debug mode"""
+
+        debug = bottle.DEBUG
+        main.create_app(db_path=':memory:', caches=False)
+        self.assertFalse(main.TEMPLATE_CACHE)
+        self.assertEqual(debug, bottle.DEBUG)
+
+        main.create_app(db_path=':memory:')
+        self.assertTrue(main.TEMPLATE_CACHE)
+
+        with self.assertRaises(ValueError):
+            main.create_app(db_path=':memory:', caches=False, precompile=True)
+
+    def test_precompile_templates(self):
+        """All of the templates are compiled before the first request"""
+
+        bottle.TEMPLATES.clear()
+        main.create_app(db_path=':memory:', precompile=True)
+
+        for name in ['index', 'product', 'cart', 'base']:
+            tpl = bottle.TEMPLATES[(id(bottle.TEMPLATE_PATH), name)]
+            self.assertIn('co', tpl.__dict__, "Template %s was not compiled" % name)
+            # the base template is shared rather than compiled again on rebase
+            self.assertIs(bottle.TEMPLATES[(id(bottle.TEMPLATE_PATH), 'base')], tpl.cache['base.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
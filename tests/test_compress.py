@@ -0,0 +1,150 @@
+import unittest
+import gzip
+from webob import Request
+
+import compress
+
+
+def make_app(body, content_type='text/html; charset=UTF-8', headers=None, chunked=False):
+    """Return a simple WSGI app that always sends the given body"""
+
+    def app(environ, start_response):
+        response_headers = [('Content-Type', content_type)] + list(headers or [])
+        if not chunked:
+            response_headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', response_headers)
+        if chunked:
+            return (body[i:i + 100] for i in range(0, len(body), 100))
+        return [body]
+
+    return app
+
+
+def get(app, accept_encoding):
+    """Make a GET request to the app without any decoding of the response"""
+
+    return Request.blank('/', headers={'Accept-Encoding': accept_encoding}).get_response(app)
+
+
+class CompressTests(unittest.TestCase):
+
+    def setUp(self):
+        self.body = b"<div class='product'>Yellow Wool Jumper $42.95</div>\n" * 100
+
+    def test_compresses_large_html(self):
+        """Large HTML responses are gzipped when the client accepts it"""
+
+        middleware = compress.GzipMiddleware(make_app(self.body))
+        response = get(middleware, 'gzip, deflate')
+
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(self.body, gzip.decompress(response.body))
+
+        stats = middleware.stats.as_dict()
+        self.assertEqual(1, stats['responses'])
+        self.assertEqual(len(self.body), stats['bytes_in'])
+        self.assertEqual(len(response.body), stats['bytes_out'])
+        self.assertGreater(stats['bytes_saved'], 0)
+
+    def test_compresses_streamed_body(self):
+        """Bodies produced as a generator are compressed too"""
+
+        middleware = compress.GzipMiddleware(make_app(self.body, chunked=True))
+        response = get(middleware, 'gzip')
+
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual(self.body, gzip.decompress(response.body))
+
+    def test_client_without_gzip(self):
+        """Clients that don't accept gzip get the plain body but still a Vary header"""
+
+        middleware = compress.GzipMiddleware(make_app(self.body))
+        for accept in ['identity', 'gzip;q=0']:
+            response = get(middleware, accept)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual('Accept-Encoding', response.headers['Vary'])
+            self.assertEqual(self.body, response.body)
+
+    def test_skip_small_and_binary(self):
+        """Tiny responses, non-text and already encoded responses are left alone"""
+
+        apps = [
+            make_app(b"<p>tiny</p>"),
+            make_app(self.body, content_type='image/png'),
+            make_app(self.body, headers=[('Content-Encoding', 'br')]),
+        ]
+        for app in apps:
+            middleware = compress.GzipMiddleware(app)
+            response = get(middleware, 'gzip')
+            self.assertNotEqual('gzip', response.headers.get('Content-Encoding'))
+            self.assertEqual(0, middleware.stats.responses)
+            self.assertEqual(1, middleware.stats.skipped)
+
+    def test_existing_vary(self):
+        """Accept-Encoding is added to an existing Vary header"""
+
+        middleware = compress.GzipMiddleware(make_app(self.body, headers=[('Vary', 'Cookie')]))
+        response = get(middleware, 'gzip')
+
+        self.assertEqual('Cookie, Accept-Encoding', response.headers['Vary'])
+
+    def test_etag_changed(self):
+        """The gzipped response doesn't share the ETag of the plain one"""
+
+        middleware = compress.GzipMiddleware(make_app(self.body, headers=[('ETag', '"abc123"')]))
+
+        self.assertEqual('"abc123-gzip"', get(middleware, 'gzip').headers['ETag'])
+        self.assertEqual('"abc123"', get(middleware, 'identity').headers['ETag'])
+
+    def test_etag_revalidation(self):
+        """Sending back the ETag of a gzipped response still gets a 304 from the app"""
+
+        def app(environ, start_response):
+            if environ.get('HTTP_IF_NONE_MATCH') == '"abc123"':
+                start_response('304 Not Modified', [('ETag', '"abc123"')])
+                return []
+            start_response('200 OK', [('Content-Type', 'text/css'), ('ETag', '"abc123"'),
+                                      ('Accept-Ranges', 'bytes')])
+            return [self.body]
+
+        middleware = compress.GzipMiddleware(app)
+        response = get(middleware, 'gzip')
+        self.assertNotIn('Accept-Ranges', response.headers)
+        etag = response.headers['ETag']
+
+        request = Request.blank('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        response = request.get_response(middleware)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response.headers['ETag'])
+
+    def test_strip_gzip_etags(self):
+        """Our ETag suffix is removed from quoted, unquoted and weak ETags"""
+
+        self.assertEqual('"a", W/"b", c', compress._strip_gzip_etags('"a-gzip", W/"b-gzip", c-gzip'))
+        self.assertEqual('"a-gzipped"', compress._strip_gzip_etags('"a-gzipped"'))
+
+    def test_explicit_gzip_beats_wildcard(self):
+        """An explicit gzip entry takes precedence over *"""
+
+        self.assertTrue(compress.accepts_gzip({'HTTP_ACCEPT_ENCODING': '*;q=0, gzip'}))
+        self.assertFalse(compress.accepts_gzip({'HTTP_ACCEPT_ENCODING': 'gzip;q=0, *'}))
+        self.assertTrue(compress.accepts_gzip({'HTTP_ACCEPT_ENCODING': '*'}))
+        self.assertFalse(compress.accepts_gzip({'HTTP_ACCEPT_ENCODING': 'br'}))
+
+    def test_lazy_start_response(self):
+        """Apps that only call start_response when iterated work with min_size=0"""
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/html')])
+            yield self.body
+
+        middleware = compress.GzipMiddleware(app, min_size=0)
+        response = get(middleware, 'gzip')
+
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual(self.body, gzip.decompress(response.body))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import bottle
+from beaker.middleware import SessionMiddleware
+from webtest import TestApp
+
+import memprofile
+
+
+class MemoryProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = bottle.Bottle()
+        self.kept = []
+
+        @self.app.get('/leak')
+        def leak():
+            self.kept.append(bytearray(100000))
+            return "leaked"
+
+        @self.app.get('/cart')
+        def cart():
+            session = bottle.request.environ['beaker.session']
+            session['cart'] = [{'id': 1, 'quantity': 2, 'name': 'test', 'cost': 12.5}]
+            session.save()
+            return "cart"
+
+        self.plugin = memprofile.MemoryProfilePlugin()
+        self.app.install(self.plugin)
+        self.client = TestApp(SessionMiddleware(self.app, {'session.type': 'memory'}),
+                              extra_environ={'REMOTE_ADDR': '127.0.0.1'})
+
+    def tearDown(self):
+        self.app.uninstall(self.plugin)
+
+    def test_route_figures(self):
+        """Each route records its peak and retained memory"""
+
+        self.client.get('/leak')
+        self.client.get('/leak')
+
+        stats = self.plugin.report()['routes']['GET /leak']
+        self.assertEqual(2, stats['requests'])
+        self.assertGreaterEqual(stats['peak'], 100000)
+        self.assertGreaterEqual(stats['retained'], 200000)
+
+    def test_admin_report(self):
+        """The admin page shows the largest new allocation sites and the session store"""
+
+        self.client.get('/leak')
+        self.client.get('/cart')
+
+        report = self.client.get(memprofile.ADMIN_PATH).json
+        self.assertIn('GET /leak', report['routes'])
+        self.assertNotIn('GET ' + memprofile.ADMIN_PATH, report['routes'])
+        self.assertTrue(any('test_memprofile.py' in site['site'] for site in report['sites']))
+        self.assertGreaterEqual(report['sessions']['carts'], 1)
+        self.assertGreater(report['sessions']['cart_bytes_max'], 0)
+
+    def test_admin_report_local_only(self):
+        """Other clients can't see the report"""
+
+        self.client.get(memprofile.ADMIN_PATH, extra_environ={'REMOTE_ADDR': '10.1.1.1'}, status=403)
+
+    def test_session_store_elsewhere(self):
+        """The session figures are not available unless sessions are kept in memory"""
+
+        self.assertIsNone(memprofile.session_store_stats('file'))
+        self.plugin.session_type = 'ext:database'
+        self.assertIsNone(self.plugin.report()['sessions'])
+
+    def test_disabled(self):
+        """Uninstalling the plugin stops tracing and removes the report"""
+
+        self.app.uninstall(self.plugin)
+        self.assertFalse(memprofile.tracemalloc.is_tracing())
+        self.client.get(memprofile.ADMIN_PATH, status=404)
+        self.app.install(self.plugin)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,6 +50,16 @@ class ModelTests(unittest.TestCase):
         self.assertEqual(product['id'], result['id'])
         self.assertEqual(product['name'], result['name'])
 
+    def test_product_get_many(self):
+        """Test whether we can retrieve several products at once from their ids"""
+
+        wanted = [self.products[name] for name in ['Yellow Wool Jumper', 'Classic Varsity Top']]
+        result = model.product_get_many(self.db, [str(p['id']) for p in wanted] + [99999])
+
+        self.assertEqual(2, len(result))
+        for product in wanted:
+            self.assertEqual(product['name'], result[product['id']]['name'])
+
 
 
 if __name__=='__main__':
@@ -0,0 +1,104 @@
+import unittest
+
+import pricing
+import dbschema
+
+
+class PricingTests(unittest.TestCase):
+
+    def setUp(self):
+
+        # init an in-memory database
+        self.db = dbschema.connect(':memory:')
+        dbschema.create_tables(self.db)
+        self.products = dbschema.sample_data(self.db)
+
+    def cart_entry(self, name, quantity):
+        """Return a cart entry for quantity of the named product, as added by session.add_to_cart"""
+
+        product = self.products[name]
+        return {'id': str(product['id']), 'quantity': quantity, 'name': name,
+                'cost': float(quantity) * product['unit_cost']}
+
+    def test_cents(self):
+        """Amounts are converted to and from whole cents"""
+
+        self.assertEqual(4295, pricing.to_cents(42.95))
+        self.assertEqual(12885, pricing.to_cents(3 * 42.95))
+        self.assertEqual('42.95', pricing.format_cents(4295))
+        self.assertEqual('0.05', pricing.format_cents(5))
+
+    def test_price_cart(self):
+        """Line totals and the cart total are computed in cents"""
+
+        self.db.execute("UPDATE products SET inventory = 50")
+        cart = [self.cart_entry('Yellow Wool Jumper', 3), self.cart_entry('Classic Varsity Top', 2)]
+
+        lines, total = pricing.price_cart(self.db, cart)
+
+        self.assertEqual(2, len(lines))
+        expected = 0
+        for line, entry in zip(lines, cart):
+            unit = pricing.to_cents(self.products[entry['name']]['unit_cost'])
+            self.assertEqual(unit * entry['quantity'], line['cost_cents'])
+            self.assertFalse(line['repriced'])
+            self.assertFalse(line['out_of_stock'])
+            expected += unit * entry['quantity']
+        self.assertEqual(expected, total)
+
+    def test_repriced_and_out_of_stock(self):
+        """Lines are flagged if the price changed or there is no longer enough stock"""
+
+        self.db.execute("UPDATE products SET inventory = 50")
+        jumper = self.products['Yellow Wool Jumper']
+        top = self.products['Classic Varsity Top']
+        cart = [self.cart_entry('Yellow Wool Jumper', 1), self.cart_entry('Classic Varsity Top', 2),
+                {'id': '99999', 'quantity': 1, 'name': 'Gone', 'cost': 1.0}]
+
+        self.db.execute("UPDATE products SET unit_cost = 10.5 WHERE id = ?", (jumper['id'],))
+        self.db.execute("UPDATE products SET inventory = 1 WHERE id = ?", (top['id'],))
+
+        lines, total = pricing.price_cart(self.db, cart)
+
+        self.assertTrue(lines[0]['repriced'])
+        self.assertEqual('10.50', lines[0]['cost'])
+        self.assertTrue(lines[1]['out_of_stock'])
+        self.assertTrue(lines[2]['out_of_stock'])
+        self.assertEqual('Gone', lines[2]['name'])
+        # only the available line counts towards the total
+        self.assertEqual(1050, total)
+
+    def test_non_canonical_id(self):
+        """An id like '3.0' finds its product, an id that isn't a number marks
+        its line out of stock rather than failing"""
+
+        self.db.execute("UPDATE products SET inventory = 50")
+        top = self.products['Classic Varsity Top']
+        cart = [self.cart_entry('Yellow Wool Jumper', 1),
+                dict(self.cart_entry('Classic Varsity Top', 1), id="%d.0" % top['id']),
+                {'id': 'abc', 'quantity': 1, 'name': 'Odd', 'cost': 1.0}]
+
+        lines, total = pricing.price_cart(self.db, cart)
+
+        self.assertFalse(lines[0]['out_of_stock'])
+        self.assertFalse(lines[1]['out_of_stock'])
+        self.assertFalse(lines[1]['repriced'])
+        self.assertTrue(lines[2]['out_of_stock'])
+        self.assertEqual('Odd', lines[2]['name'])
+        self.assertEqual(lines[0]['cost_cents'] + lines[1]['cost_cents'], total)
+        self.assertIsNone(pricing.product_id('3.5'))
+
+    def test_single_query(self):
+        """The whole cart is revalidated with one query"""
+
+        cart = [self.cart_entry(name, 1) for name in self.products]
+        statements = []
+        self.db.set_trace_callback(statements.append)
+
+        pricing.price_cart(self.db, cart)
+
+        self.assertEqual(1, len([sql for sql in statements if sql.startswith('SELECT')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -159,5 +159,20 @@ class SessionTests(unittest.TestCase):
         self.assertEqual(product['id'], cart[0]['id'], "Test adding excessive quantity of products")
         self.assertEqual(quantity*2, cart[0]['quantity'], "Test adding excessive quantity of products")
 
+    def test_cart_canonical_id(self):
+        """An id like '3.0' is stored as the product's own id and merges with it"""
+
+        request.environ['beaker.session'] = MockBeakerSession({'cart': []})
+        self.db.execute("UPDATE products SET inventory = 50")
+        product = self.products['Classic Varsity Top']
+
+        session.add_to_cart(self.db, "%d.0" % product['id'], 1)
+        session.add_to_cart(self.db, product['id'], 1)
+        cart = session.get_cart_contents()
+
+        self.assertEqual(1, len(cart))
+        self.assertEqual(product['id'], cart[0]['id'])
+        self.assertEqual(2, cart[0]['quantity'])
+
 if __name__=='__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sqlite3
+import threading
+
+import model
+import shards
+import dbschema
+
+
+class ShardTests(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.layout = shards.ShardLayout(self.directory)
+        self.layout.create_tables()
+        self.products = dbschema.sample_data(None, self.layout)
+        shards.configure(self.layout)
+
+        # the main database has no products at all, everything comes from the shards
+        self.db = dbschema.connect(':memory:')
+        dbschema.create_tables(self.db)
+
+    def tearDown(self):
+        shards.configure(None)
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def test_one_file_per_category(self):
+        """Each category is stored in its own file"""
+
+        for name in ['men', 'women']:
+            shard = self.layout.shard_for_category(name)
+            self.assertTrue(os.path.exists(self.layout.filename(shard)))
+            db = self.layout.connect(shard)
+            categories = set(row[0] for row in db.execute("SELECT category FROM products"))
+            db.close()
+            self.assertEqual({name}, categories)
+
+    def test_ids_unique(self):
+        """Product ids are unique across the shards"""
+
+        ids = [p['id'] for p in self.products.values()]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_new_ids_in_shard_range(self):
+        """Products inserted without an id get one from their shard's range,
+        ids from another shard's range are refused"""
+
+        for name in ['men', 'women', 'kids']:
+            shard = self.layout.shard_for_category(name)
+            db = self.layout.connect(shard)
+            empty = db.execute("SELECT count(*) FROM products").fetchone()[0] == 0
+            cur = db.execute("INSERT INTO products (name, category) VALUES ('New', ?)", (name,))
+            self.assertEqual(shard, self.layout.shard_for_id(cur.lastrowid))
+            if empty:
+                self.assertEqual(self.layout.base_id(shard), cur.lastrowid)
+            if shard > 0:
+                with self.assertRaises(sqlite3.IntegrityError):
+                    db.execute("INSERT INTO products (id, name) VALUES (1, 'Wrong')")
+            db.close()
+
+    def test_product_list(self):
+        """Listing all products merges the shards"""
+
+        products = model.product_list(self.db)
+        self.assertEqual(sorted(self.products), sorted(p['name'] for p in products))
+
+    def test_product_list_category(self):
+        """Listing a category only returns products in that category"""
+
+        products = model.product_list(self.db, category="men")
+
+        self.assertEqual(6, len(products))
+        for product in products:
+            self.assertEqual('men', product['category'])
+
+    def test_product_get(self):
+        """Products are found in their shard from the id"""
+
+        for product in self.products.values():
+            result = model.product_get(self.db, str(product['id']))
+            self.assertEqual(product['name'], result['name'])
+
+        self.assertIsNone(model.product_get(self.db, 99999999))
+        self.assertIsNone(model.product_get(self.db, 'nonsense'))
+
+    def test_parallel_writes(self):
+        """Writes to different shards do not block each other"""
+
+        men = self.layout.connect(self.layout.shard_for_category('men'))
+        men.execute("UPDATE products SET inventory = 1")
+
+        # with men's write transaction open we can still write to women's catalog
+        def update_women():
+            women = self.layout.connect(self.layout.shard_for_category('women'))
+            women.execute("PRAGMA busy_timeout = 0")
+            women.execute("UPDATE products SET inventory = 2")
+            women.commit()
+            women.close()
+
+        thread = threading.Thread(target=update_women)
+        thread.start()
+        thread.join()
+        men.commit()
+        men.close()
+
+        for product in model.product_list(self.db, 'women'):
+            self.assertEqual(2, product['inventory'])
+
+
+if __name__ == '__main__':
+    unittest.main()
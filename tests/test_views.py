@@ -1,6 +1,5 @@
 import unittest
 import os
-from bottle.ext import sqlite, beaker
 import bottle
 import html
 from webtest import TestApp
@@ -11,23 +10,14 @@ import urllib
 import uuid
 
 DATABASE_NAME = "test.db"
-# initialise the sqlite plugin for bottle
-main.app.install(sqlite.Plugin(dbfile=DATABASE_NAME))
 bottle.debug()
 
-# make sure bottle looks for templates in the main directory, not this one
-bottle.TEMPLATE_PATH = [os.path.join(os.path.dirname(__file__), p) for p in ['../', '../views/']]
-
 
 class FunctionalTests(unittest.TestCase):
 
     def setUp(self):
-        session_opts = {
-            'session.type': 'memory',
-        }
-        beaker_app = beaker.middleware.SessionMiddleware(main.app, session_opts)
-
-        self.app = TestApp(beaker_app)
+        # the app factory installs the sqlite plugin and finds the templates for us
+        self.app = TestApp(main.create_app(db_path=DATABASE_NAME, caches=False))
         self.db = dbschema.connect(DATABASE_NAME)
         dbschema.create_tables(self.db)
         self.products = dbschema.sample_data(self.db)